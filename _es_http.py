@@ -0,0 +1,86 @@
+# _es_http.py
+# Shared cluster config + HTTP transport for every script: one Retry policy, one
+# session/pool factory, built lazily so importing this module opens nothing.
+# Not meant to be run directly.
+# Requires: pip install requests  (urllib3 comes with it)
+
+from functools import lru_cache
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter, Retry
+
+# ------------------- CONFIG -------------------
+ES = "http://192.168.40.23:9200"
+AUTH = None  # e.g., ("elastic", "your-password")
+
+# alias-rollover naming (quicktests + their cleanup)
+ALIAS = "bench-rollover"
+INDEX_PREFIX = "bench-rollover-"
+# ---------------------------------------------
+
+# back off and replay on indexing pressure (429) and gateway errors; bulk bodies are
+# in-memory buffers, so a retry just resends them
+RETRY_ARGS = dict(
+    total=6, connect=3, read=3, backoff_factor=0.5,
+    status_forcelist=(429, 502, 503, 504),
+    raise_on_status=False,
+)
+RETRY_METHODS = {"GET", "POST", "PUT", "HEAD"}
+# urllib3 < 1.26 uses method_whitelist — newer uses allowed_methods
+try:
+    RETRY = Retry(**RETRY_ARGS, allowed_methods=RETRY_METHODS)
+except TypeError:
+    RETRY = Retry(**RETRY_ARGS, method_whitelist=RETRY_METHODS)
+
+@lru_cache(maxsize=1)
+def get_session() -> requests.Session:
+    # one keep-alive session for every control-plane call (no TCP handshake per request)
+    s = requests.Session()
+    adapter = HTTPAdapter(max_retries=RETRY, pool_connections=4, pool_maxsize=16)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    s.headers.update({"Accept-Encoding": "gzip", "Connection": "keep-alive"})
+    return s
+
+def bulk_headers(gzip: bool = False) -> dict:
+    # per-call headers replace the pool's, so callers overriding them start from here
+    headers = {"Content-Type": "application/x-ndjson", "Connection": "keep-alive"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    if AUTH:
+        headers.update(urllib3.util.make_headers(basic_auth=":".join(AUTH)))
+    return headers
+
+def make_bulk_pool(maxsize: int, gzip: bool = False, **kw) -> urllib3.PoolManager:
+    # bulk hot path: urllib3 directly, skipping requests' per-call prepare/hooks
+    return urllib3.PoolManager(num_pools=1, maxsize=maxsize, headers=bulk_headers(gzip),
+                               retries=RETRY, **kw)
+
+@lru_cache(maxsize=1)
+def get_gzip_bulk_pool() -> urllib3.PoolManager:
+    return make_bulk_pool(16, gzip=True, block=True)
+
+_SIZE_UNITS = {"b": 1, "kb": 1 << 10, "mb": 1 << 20, "gb": 1 << 30, "tb": 1 << 40}
+
+def parse_es_size(s: str) -> int:
+    # ES byte-size strings ("50gb", "100mb", "512b") -> bytes
+    s = s.strip().lower()
+    unit = s[-2:] if s[-2:] in _SIZE_UNITS else s[-1:]
+    if unit not in _SIZE_UNITS:
+        return int(s)
+    return int(float(s[:-len(unit)]) * _SIZE_UNITS[unit])
+
+def req(method: str, path: str, _check: bool = True, **kw) -> requests.Response:
+    kw.setdefault("timeout", 180)
+    r = get_session().request(method, ES + path, auth=AUTH, **kw)
+    if _check and r.status_code >= 300:
+        raise RuntimeError(f"{method} {path} -> {r.status_code}\n{r.text[:800]}")
+    return r
+
+def post_gzip_bulk(path: str, body) -> urllib3.HTTPResponse:
+    # body: gzipped ndjson as bytes or memoryview; returns the urllib3 response
+    r = get_gzip_bulk_pool().urlopen("POST", ES + path, body=body, timeout=300)
+    if r.status >= 300:
+        raise RuntimeError(f"bulk -> {r.status}\n{r.data[:800].decode('utf-8', 'replace')}")
+    return r
@@ -1,23 +1,12 @@
 #!/usr/bin/env python3
 # cleanup_alias_rollover.py
 # pip install requests
-import requests
-
-ES = "http://192.168.40.23:9200"
-AUTH = None
-ALIAS = "bench-rollover"
-PREFIX = "bench-rollover-"
-
-def req(m,p,**kw):
-    r = requests.request(m, ES+p, auth=AUTH, timeout=120, **kw)
-    if r.status_code >= 300:
-        raise RuntimeError(f"{m} {p} -> {r.status_code}\n{r.text[:800]}")
-    return r
+from _es_http import ALIAS, INDEX_PREFIX as PREFIX, req
 
 def main():
     try:
         # remove alias from all indices (if exists)
-        a = requests.get(f"{ES}/_alias/{ALIAS}", auth=AUTH, timeout=30)
+        a = req("GET", f"/_alias/{ALIAS}", _check=False, timeout=30)
         if a.status_code == 200:
             actions = []
             for idx in a.json().keys():
@@ -28,12 +17,15 @@ def main():
     except Exception as e:
         print("Alias remove note:", e)
 
-    # delete indices with prefix
-    cat = req("GET","/_cat/indices?h=index&s=index").text.strip().splitlines()
-    targets = [i for i in cat if i.startswith(PREFIX)]
+    # delete indices with prefix: let ES expand the wildcard (no full _cat/indices scan)
+    found = req("GET", f"/{PREFIX}*/_settings/index.provided_name"
+                       "?expand_wildcards=open,closed&allow_no_indices=true").json()
+    targets = sorted(found)
     if targets:
+        # explicit names, not a wildcard: ES 8+ rejects wildcard deletes by default
+        # (action.destructive_requires_name)
         j = ",".join(targets)
-        req("DELETE", f"/{j}")
+        req("DELETE", f"/{j}?ignore_unavailable=true")
         print(f"Deleted indices: {targets}")
     else:
         print("No indices to delete.")
@@ -1,10 +1,9 @@
 #!/usr/bin/env python3
 # cleanup_datastream.py
 # pip install requests
-import requests
+from concurrent.futures import ThreadPoolExecutor
 
-ES = "http://192.168.40.23:9200"
-AUTH = None
+from _es_http import req
 
 DS = "bench-logs"
 IT_NAME = "it-bench-logs"
@@ -12,42 +11,36 @@ CT_SETTINGS = "bench-logs@settings"
 CT_MAPPINGS = "bench-logs@mappings"
 ILM = "bench-90d"  # optional to delete
 
-def req(m,p,**kw):
-    r = requests.request(m, ES+p, auth=AUTH, timeout=120, **kw)
-    if r.status_code >= 300:
-        raise RuntimeError(f"{m} {p} -> {r.status_code}\n{r.text[:800]}")
-    return r
+def delete_note(path, what):
+    try:
+        req("DELETE", path)
+        print(f"Deleted {what}.")
+    except Exception as e:
+        print(f"Delete note ({what}):", e)
 
 def main():
     # delete data stream (deletes backing indices)
-    r = requests.get(f"{ES}/_data_stream/{DS}", auth=AUTH, timeout=30)
-    if r.status_code == 200:
-        req("DELETE", f"/_data_stream/{DS}")
-        print(f"Deleted data stream '{DS}' and backing indices.")
-    else:
+    # delete straight away: the DS delete API has no ignore_unavailable, so 404 means absent
+    r = req("DELETE", f"/_data_stream/{DS}", _check=False)
+    if r.status_code == 404:
         print("Data stream not present.")
+    elif r.status_code >= 300:
+        raise RuntimeError(f"DELETE /_data_stream/{DS} -> {r.status_code}\n{r.text[:800]}")
+    else:
+        print(f"Deleted data stream '{DS}' and backing indices.")
 
-    # delete index template
-    try:
-        req("DELETE", f"/_index_template/{IT_NAME}")
-        print(f"Deleted index template '{IT_NAME}'.")
-    except Exception as e:
-        print("Index template delete note:", e)
-
-    # delete component templates
-    for ct in [CT_SETTINGS, CT_MAPPINGS]:
-        try:
-            req("DELETE", f"/_component_template/{ct}")
-            print(f"Deleted component template '{ct}'.")
-        except Exception as e:
-            print(f"Component template delete note ({ct}):", e)
-
-    # optional: delete ILM policy (only if not shared!)
-    try:
-        req("DELETE", f"/_ilm/policy/{ILM}")
-        print(f"Deleted ILM policy '{ILM}'.")
-    except Exception as e:
-        print("ILM delete note:", e)
+    # with the DS gone the rest can go concurrently, with one ordering rule: the
+    # index template references the component templates, so it has to go first
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        it = ex.submit(delete_note, f"/_index_template/{IT_NAME}",
+                       f"index template '{IT_NAME}'")
+        # optional: delete ILM policy (only if not shared!)
+        pol = ex.submit(delete_note, f"/_ilm/policy/{ILM}", f"ILM policy '{ILM}'")
+        it.result()
+        cts = [ex.submit(delete_note, f"/_component_template/{ct}",
+                         f"component template '{ct}'") for ct in [CT_SETTINGS, CT_MAPPINGS]]
+        for f in cts + [pol]:
+            f.result()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,363 @@
+# ilm_common.py
+# Shared config + HTTP / bulk / report helpers for the alias-rollover quicktests
+# (ag_es_centralized_ilm_alias_rollover_v3.py / _v4.py). Not meant to be run directly.
+# Requires: pip install requests  (urllib3 comes with it; orjson optional)
+
+import base64, json, os, queue, re, threading, time, zlib
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import requests
+import urllib3
+
+import _es_http
+# cluster address/credentials, naming and the HTTP transport live in _es_http
+from _es_http import ALIAS, ES, INDEX_PREFIX, bulk_headers, make_bulk_pool, parse_es_size
+
+try:  # optional: C-accelerated parsing of bulk/alias/settings responses
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# ------------------- CONFIG -------------------
+# naming (ALIAS / INDEX_PREFIX come from _es_http)
+FIRST_INDEX = f"{INDEX_PREFIX}000001"
+ILM = "bench-quick"
+
+# shard/replicas & rollover
+PRIMARY_SHARDS = 3
+REPLICAS = 1
+MAX_PRIMARY_SHARD_SIZE = "50gb"
+
+# quick ILM ages for demo (hot->warm->cold in minutes; delete age is per script)
+WARM_AGE = "2m"
+COLD_AGE = "4m"
+
+# ingest knobs (we’ll adapt docs/batch to server limits)
+RAW_PAYLOAD_BYTES = 2 * 1024 * 1024  # 2 MiB raw => ~2.66–2.80 MiB base64/doc
+CLIENT_TIMEOUT: Tuple[float, float] = (10.0, 600.0)  # (connect, read) sec
+MAX_MINUTES = 60                     # safety cap for the demo
+SAFETY_MARGIN = 0.85                 # stay under 85% of http.max_content_length
+WORKERS = 4                          # concurrent bulk senders (one pooled conn each)
+COMPRESS = False                     # base64 only deflates ~23%; not worth ~3 s CPU per 85 MB bulk
+COMPRESS_LEVEL = 1                   # level 1 saves ~23%, level 9 ~24%, at a fraction of the CPU
+# ---------------------------------------------
+
+# Bulk hot path: _es_http's shared Retry policy, one pooled keep-alive connection
+# per sender thread. Control-plane calls go through _es_http's session.
+BULK_HEADERS = bulk_headers()
+BULK_POOL = make_bulk_pool(
+    WORKERS, timeout=urllib3.Timeout(connect=CLIENT_TIMEOUT[0], read=CLIENT_TIMEOUT[1]),
+)
+
+# ------------------- HTTP helpers -------------------
+def req(method: str, path: str, _check: bool = True, **kw) -> requests.Response:
+    return _es_http.req(method, path, _check, timeout=CLIENT_TIMEOUT, **kw)
+
+def _head_ok(path: str) -> bool:
+    return req("HEAD", path, _check=False, allow_redirects=False).status_code == 200
+
+def exists_index(index: str) -> bool:
+    return _head_ok(f"/{index}")
+
+def exists_alias(alias: str) -> bool:
+    return _head_ok(f"/_alias/{alias}")
+
+# ------------------- index + alias -------------------
+def create_write_index_and_alias():
+    if exists_index(FIRST_INDEX):
+        print(f"ℹ️  Index {FIRST_INDEX} already exists; skipping create.")
+        return
+    if exists_alias(ALIAS):
+        info = json_loads(req("GET", f"/_alias/{ALIAS}").content)
+        for idx, meta in info.items():
+            if meta.get("aliases", {}).get(ALIAS, {}).get("is_write_index"):
+                raise RuntimeError(
+                    f"Alias '{ALIAS}' already has write index '{idx}'. "
+                    f"Remove/rename it or change ALIAS/INDEX_PREFIX."
+                )
+    body = {
+        "settings": {
+            "index.number_of_shards": PRIMARY_SHARDS,
+            "index.number_of_replicas": REPLICAS,
+            "index.lifecycle.name": ILM,
+            "index.lifecycle.rollover_alias": ALIAS,
+            "index.refresh_interval": "30s",
+        },
+        "mappings": {
+            "properties": {
+                "@timestamp": {"type": "date"},
+                "service.name": {"type": "keyword"},
+                "log.level": {"type": "keyword"},
+                "message": {"type": "binary"}  # big field; not indexed
+            },
+            "dynamic_templates": [
+                {"strings_as_keywords": {
+                    "match_mapping_type": "string",
+                    "mapping": {"type": "keyword", "ignore_above": 256}
+                }}
+            ]
+        },
+        "aliases": {ALIAS: {"is_write_index": True}}
+    }
+    req("PUT", f"/{FIRST_INDEX}", json=body)
+
+def get_write_index(alias: str) -> str:
+    data = json_loads(req("GET", f"/_alias/{alias}").content)
+    for idx, meta in data.items():
+        if meta.get("aliases", {}).get(alias, {}).get("is_write_index"):
+            return idx
+    raise RuntimeError(f"Write index for alias '{alias}' not found")
+
+def set_fast(index: str, on: bool = True):
+    settings = {"index": {"refresh_interval": "-1", "translog.durability": "async"}} if on else \
+               {"index": {"refresh_interval": "30s", "translog.durability": "request"}}
+    req("PUT", f"/{index}/_settings", json=settings)
+
+# -------- server limits & batch sizing ----------
+@lru_cache(maxsize=1)
+def get_http_max_content_length_bytes() -> int:
+    js = json_loads(req("GET", "/_cluster/settings?include_defaults=true").content)
+    # explicit persistent / transient first, then the effective default
+    for root in ("persistent", "transient", "defaults"):
+        v = js.get(root, {}).get("http", {}).get("max_content_length")
+        if isinstance(v, str):
+            return parse_es_size(v)
+    # If unknown, assume ES's default 100MB
+    return 100 * 1024 * 1024
+
+def docs_per_batch(avg_doc_bytes: int, max_bytes: int) -> int:
+    # rough per-doc overhead for action/meta + newline
+    per_doc = avg_doc_bytes + 64
+    # hold back to safety margin
+    budget = int(max_bytes * SAFETY_MARGIN)
+    return max(1, budget // per_doc)
+
+# -------- bulk helpers (optional gzip + adapt) ----------
+# base64 has no JSON-special chars, so the payload is spliced in without json.dumps
+DOC_TEMPLATE = (b'{"@timestamp":"2025-11-05T12:00:00Z","service.name":"bench",'
+                b'"log.level":"info","message":"%b"}')
+
+def bulk_ndjson(doc_line: bytes, n: int) -> bytes:
+    # doc_line is the pre-encoded doc; every bulk repeats the same action+doc pair
+    return (b'{"index":{}}\n' + doc_line + b"\n") * n
+
+def gzip_chunks(b: memoryview, chunk: int = 64 * 1024) -> Iterator[bytes]:
+    # wbits=31 -> gzip framing straight from zlib; compress 64 KiB at a time so
+    # deflate overlaps the (chunked) upload instead of finishing before it
+    co = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+    for off in range(0, len(b), chunk):
+        out = co.compress(b[off:off + chunk])
+        if out:
+            yield out
+    yield co.flush()
+
+_INDEX_RE = re.compile(rb'"_index":"([^"]+)"')
+
+def post_bulk_with_adapt(alias: str, ndjson: memoryview, docs_in_batch: int) -> Tuple[int, Optional[str]]:
+    """
+    Returns (docs actually sent, index the bulk landed in).
+    Docs sent is -1 on any timeout/connection error or backpressure, telling
+    the caller to halve the batch.
+    """
+    headers = BULK_HEADERS
+    payload: Union[memoryview, Iterator[bytes]] = ndjson
+    opts: Dict = {}
+    if COMPRESS:
+        # a generator body can't be replayed: no urllib3 retries, the caller's
+        # shrink/back-off path handles failures instead
+        headers = bulk_headers(gzip=True)
+        payload = gzip_chunks(ndjson)
+        opts = {"chunked": True, "retries": False}
+
+    try:
+        r = BULK_POOL.urlopen("POST", f"{ES}/{alias}/_bulk", body=payload, headers=headers, **opts)
+    except urllib3.exceptions.HTTPError:
+        # halve the batch size signal to caller (timeouts, resets, retries exhausted)
+        return -1, None
+
+    if r.status >= 300:
+        # if ES returns 413 (too large) or 429/backpressure, tell caller to shrink
+        if r.status in (413, 429, 502, 503, 504):
+            return -1, None
+        raise RuntimeError(f"bulk -> {r.status}\n{r.data[:800].decode('utf-8', 'replace')}")
+    # "errors" sits in the first few bytes of the (compact) bulk response;
+    # probe for it instead of parsing every item result
+    if b'"errors":true' in r.data[:512]:
+        # still count as sent but advise shrinking
+        print("⚠️  bulk item errors present (consider shrinking batch)")
+    # every item reports the concrete index it landed in, i.e. the current write index
+    m = _INDEX_RE.search(r.data)
+    return docs_in_batch, m.group(1).decode() if m else None
+
+# -------------- ingest ----------------
+def run_ingest_until_rollovers(target_rollovers: int,
+                               prepare_write_index: Optional[Callable[[str], None]] = None):
+    """
+    Bulk-ingest into ALIAS until `target_rollovers` rollovers are seen (or MAX_MINUTES).
+    `prepare_write_index`, if given, runs on the initial and every new write index
+    before it is switched to fast settings.
+    """
+    payload = base64.b64encode(os.urandom(RAW_PAYLOAD_BYTES))  # ASCII bytes, spliced as-is
+    avg_doc_bytes = len(payload)  # ~2.7–2.8 MB base64
+    # every doc is identical: encode it once for the whole run
+    doc = DOC_TEMPLATE % payload
+    max_content = get_http_max_content_length_bytes()
+    # no extra docs/bulk cap: the body is built once and gzip streams in 64 KiB
+    # chunks, so memory is bounded by http.max_content_length, not by dpb
+    dpb = docs_per_batch(avg_doc_bytes, max_content)
+
+    print(f"Server http.max_content_length ≈ {max_content/1024/1024:.0f} MB")
+    print(f"Avg doc (b64): {avg_doc_bytes/1024/1024:.2f} MiB")
+    print(f"Docs/bulk initial: {dpb}")
+    print(f"Bulk encoding: {f'gzip (level {COMPRESS_LEVEL})' if COMPRESS else 'identity'}")
+
+    write_idx = get_write_index(ALIAS)
+    if prepare_write_index:
+        prepare_write_index(write_idx)
+    set_fast(write_idx, True)
+
+    # main thread builds bodies + handles rollovers; WORKERS threads POST them.
+    # Rollovers are seen in-band: bulk responses name the index they landed in.
+    # dpb only ever shrinks and the body is one line repeated, so every bulk is
+    # a zero-copy prefix of the first one: build it once, queue memoryview slices.
+    full = memoryview(bulk_ndjson(doc, dpb))
+    line_len = len(full) // dpb
+    q: "queue.Queue[Optional[Tuple[memoryview, int]]]" = queue.Queue(maxsize=WORKERS * 2)
+    lock = threading.Lock()
+    failures: List[BaseException] = []
+    batches = 0
+    seen_idx = write_idx
+
+    def sender():
+        nonlocal dpb, batches, seen_idx
+        while True:
+            item = q.get()
+            if item is None:
+                return
+            ndj, n = item
+            try:
+                sent, idx = post_bulk_with_adapt(ALIAS, ndj, n)
+            except Exception as e:
+                failures.append(e)
+                continue
+            if sent < 0:
+                with lock:
+                    # several in-flight bulks may fail at once; shrink once per size
+                    if dpb >= n > 1:
+                        dpb = n // 2
+                        print(f"↘️  Shrinking docs/bulk to {dpb} (timeout/backpressure)")
+                time.sleep(0.2)
+                continue
+            with lock:
+                batches += 1
+                # responses can arrive out of order; rollover names only grow
+                if idx and idx > seen_idx:
+                    seen_idx = idx
+                if batches % 10 == 0:
+                    approx_uncompressed = n * (avg_doc_bytes + 64) / (1024*1024)
+                    print(f"...{batches} bulks, docs/bulk={n}, ~{approx_uncompressed:.1f} MB (uncompressed) each")
+
+    threads = [threading.Thread(target=sender, daemon=True) for _ in range(WORKERS)]
+    for t in threads:
+        t.start()
+
+    rollovers = 0
+    start_ts = time.time()
+
+    try:
+        while not failures:
+            with lock:
+                n = dpb
+            q.put((full[:line_len * n], n))  # blocks while WORKERS*2 bulks are pending
+
+            now = time.time()
+            with lock:
+                current = seen_idx
+            if current != write_idx:
+                rollovers += 1
+                print(f"🎉 Rollover #{rollovers}: {write_idx} -> {current}")
+                # restore old, prep new
+                try: set_fast(write_idx, False)
+                except Exception as e: print("note:", e)
+                if prepare_write_index:
+                    prepare_write_index(current)
+                try: set_fast(current, True)
+                except Exception as e: print("note:", e)
+                write_idx = current
+
+                if rollovers >= target_rollovers:
+                    print("✅ Target rollovers reached. Stopping ingest.")
+                    break
+
+            if (now - start_ts) / 60 > MAX_MINUTES:
+                print("⏱️  Time cap reached. Stopping ingest.")
+                break
+    finally:
+        # drop bulks not yet picked up, then let each sender exit
+        while True:
+            try: q.get_nowait()
+            except queue.Empty: break
+        for _ in threads:
+            q.put(None)
+        for t in threads:
+            t.join()
+    if failures:
+        raise failures[0]
+
+    # restore defaults on current write
+    try: set_fast(write_idx, False)
+    except Exception as e: print("note:", e)
+
+# -------------- report ----------------
+def cat_alias() -> str:
+    return req("GET", f"/_cat/aliases/{ALIAS}?v").text
+
+def stats_for_prefix(prefix: str) -> Dict:
+    # _stats expands the wildcard server-side; no _cat/indices listing needed
+    return req("GET", f"/{prefix}*/_stats/store,docs").json().get("indices", {})
+
+def ilm_explain_indices(names: List[str]) -> Dict:
+    if not names: return {}
+    resp = req("GET", f"/{','.join(names)}/_ilm/explain").json()
+    return resp.get("indices", resp)
+
+def print_report():
+    print("\n================= FINAL REPORT =================")
+    try:
+        print("\n[Alias mapping]")
+        print(cat_alias().strip())
+    except Exception as e:
+        print("alias note:", e)
+
+    try:
+        st = stats_for_prefix(INDEX_PREFIX)
+    except Exception as e:
+        print("stats note:", e)
+        st = {}
+    idxs = sorted(st)
+    if idxs:
+        print("\n[Index list]")
+        for i in idxs: print(" -", i)
+        print("\n[Sizes (primaries vs total)]")
+        for name in idxs:
+            info = st[name]
+            p = info.get("primaries", {}).get("store", {}).get("size_in_bytes", 0)
+            t = info.get("total", {}).get("store", {}).get("size_in_bytes", 0)
+            print(f" {name:>28}  primaries={p/1024/1024/1024:.2f} GiB  total={t/1024/1024/1024:.2f} GiB")
+        try:
+            exp = ilm_explain_indices([f"{INDEX_PREFIX}*"])
+            print("\n[ILM state (phase/action/step)]")
+            if not exp:
+                print("  (No indices to explain yet.)")
+            else:
+                for name in idxs:
+                    s = exp.get(name, {})
+                    phase = s.get("phase"); action = s.get("action"); step = s.get("step")
+                    print(f" {name:>28}  phase={phase}  action={action}  step={step}")
+        except Exception as e:
+            print("ilm explain note:", e)
+    else:
+        print("\n[Index list] none found with prefix", INDEX_PREFIX)
+    print("================================================\n")